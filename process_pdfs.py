@@ -1,12 +1,37 @@
 import os
-import json
+import orjson
 from pathlib import Path
 import fitz  # PyMuPDF
-from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from functools import lru_cache
 import re
 import unicodedata
-from langdetect import detect, DetectorFactory
-DetectorFactory.seed = 0  # for reproducibility
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+
+# Languages we actually load profiles for - loading all 55 costs a lot of
+# memory and makes every detection slower. CJK and RTL text never gets this
+# far, so we only need the common Latin-script languages from CAPS_LANGS,
+# plus Cyrillic (bg, ru) and Devanagari (hi) so text in those scripts isn't
+# forced into a Latin language. Only these can come back from detect_language
+LANG_PROFILES = [
+    'en', 'es', 'fr', 'de', 'it', 'pt', 'nl', 'sv', 'da', 'fi',
+    'no', 'pl', 'tr', 'ro', 'cs', 'hu', 'bg', 'ru', 'hi',
+]
+
+def load_lang_profiles(names):
+    """Read the langdetect profile files for the given languages"""
+    profiles = []
+    for name in names:
+        with open(os.path.join(PROFILES_DIRECTORY, name), encoding='utf-8') as f:
+            profiles.append(f.read())
+    return profiles
+
+# Load the language profiles once and keep our own factory around,
+# so every detection just creates a cheap Detector from it
+_lang_factory = DetectorFactory()
+_lang_factory.load_json_profile(load_lang_profiles(LANG_PROFILES))
+_lang_factory.seed = 0  # for reproducibility
 
 # Constants for heading levels
 HEADING_LEVELS = ["H1", "H2", "H3"]
@@ -23,80 +48,143 @@ HEADING_PATTERNS = [
     r"^\d+、",  # Japanese/Chinese list: 1、
     r"^\([a-zA-Z]\)",  # (a) (A)
 ]
-HEADING_REGEXES = [re.compile(p) for p in HEADING_PATTERNS]
+# All patterns joined into one alternation, so a single match call checks them all
+HEADING_REGEX = re.compile("|".join(f"(?:{p})" for p in HEADING_PATTERNS))
+
+# Languages where capitalization (all caps, title case) hints at a heading
+CAPS_LANGS = frozenset({
+    'en', 'fr', 'de', 'es', 'it', 'pt', 'nl', 'sv', 'da', 'fi', 'no', 'pl',
+    'tr', 'ro', 'cs', 'sk', 'hu', 'sl', 'hr', 'lt', 'lv', 'et', 'bg', 'ca',
+    'ga', 'mt', 'is', 'sq', 'mk', 'bs', 'sr', 'eu', 'gl', 'af', 'sw', 'zu',
+    'xh', 'st', 'tn', 'ts', 'ss', 've', 'nr', 'ny', 'mg', 'so', 'rw', 'rn',
+    'kg', 'lu', 'lg', 'ak', 'ee', 'tw', 'ha', 'yo', 'ig', 'am', 'om', 'ti',
+    'aa',
+})
 
 # Unicode ranges for Chinese, Japanese, Korean characters
 # These languages don't use spaces between words like English does
-CJK_RANGES = [
-    (0x4E00, 0x9FFF),  # Chinese characters
-    (0x3040, 0x309F),  # Japanese hiragana
-    (0x30A0, 0x30FF),  # Japanese katakana
-    (0xAC00, 0xD7AF),  # Korean hangul
-]
+# A compiled character class lets the regex engine do the search in C
+CJK_REGEX = re.compile(
+    "["
+    "\u4E00-\u9FFF"  # Chinese characters
+    "\u3040-\u309F"  # Japanese hiragana
+    "\u30A0-\u30FF"  # Japanese katakana
+    "\uAC00-\uD7AF"  # Korean hangul
+    "]"
+)
 
 def is_cjk(text):
     """Check if text contains Chinese, Japanese, or Korean characters"""
-    for ch in text:
-        code = ord(ch)
-        for start, end in CJK_RANGES:
-            if start <= code <= end:
-                return True
-    return False
+    return CJK_REGEX.search(text) is not None
 
 def is_rtl(text):
     """Check if text is right-to-left (Arabic, Hebrew, etc.)"""
+    # Nothing before the Hebrew block (U+0590) is right-to-left, which
+    # settles plain ASCII text with a single call
+    if text.isascii():
+        return False
     for ch in text:
-        if unicodedata.bidirectional(ch) in ("R", "AL", "AN"):
+        if ch >= "\u0590" and unicodedata.bidirectional(ch) in ("R", "AL", "AN"):
             return True
     return False
 
 def normalize_text(text):
     """Clean up text by normalizing unicode characters"""
+    # Plain ASCII is already normalized, and is_normalized uses the quick
+    # check tables without building a new string, so most spans skip the work
+    if text.isascii() or unicodedata.is_normalized("NFKC", text):
+        return text
     return unicodedata.normalize("NFKC", text)
 
 def matches_heading_pattern(text):
     """Check if text matches any of our heading patterns"""
-    for regex in HEADING_REGEXES:
-        if regex.match(text):
-            return True
-    return False
+    return HEADING_REGEX.match(text) is not None
+
+class Span:
+    """A piece of text from the PDF that might be a heading"""
+    # We make thousands of these per document, so __slots__ keeps them small
+    __slots__ = ('text', 'size', 'flags', 'font', 'bbox', 'centered', 'score', 'page')
+
+    def __init__(self, text, size, flags, font, bbox, page):
+        self.text = text
+        self.size = size
+        self.flags = flags
+        self.font = font
+        self.bbox = bbox
+        self.centered = False
+        self.score = 0
+        self.page = page
 
 def is_bold(span):
     """Check if text span is bold based on font name or flags"""
-    return 'Bold' in span['font'] or (span.get('flags', 0) & 2) != 0
+    # The flag check is cheap and catches most bold text before the name search
+    return (span.flags & fitz.TEXT_FONT_BOLD) != 0 or 'Bold' in span.font
 
 def is_italic(span):
     """Check if text span is italic based on font name or flags"""
-    return 'Italic' in span['font'] or (span.get('flags', 0) & 1) != 0
+    return (span.flags & fitz.TEXT_FONT_ITALIC) != 0 or 'Italic' in span.font
 
-def is_centered(span, page_width):
+def is_centered(span, page_center, tolerance):
     """Check if text span is centered on the page"""
-    left, top, right, bottom = span['bbox']
+    left, top, right, bottom = span.bbox
     center = (left + right) / 2
-    return abs(center - page_width / 2) < page_width * 0.15
+    return abs(center - page_center) < tolerance
 
 def is_all_caps(text):
     """Check if text is all uppercase (like a heading)"""
     return text.isupper() and len(text) > 2
 
+TITLE_CASE_REGEX = re.compile(r'^[A-Z][a-z]+(?: [A-Z][a-z]+)*$')
+
 def is_title_case(text):
     """Check if text is in title case (like a heading)"""
-    return bool(re.match(r'^[A-Z][a-z]+( [A-Z][a-z]+)*$', text))
+    return TITLE_CASE_REGEX.match(text) is not None
 
+# Short labels and running titles also turn up across the PDFs one worker
+# process handles, so we remember the answer instead of asking langdetect again
+@lru_cache(maxsize=4096)
 def detect_language(text):
     """Figure out what language the text is in"""
     try:
-        return detect(text)
+        detector = _lang_factory.create()
+        detector.append(text)
+        return detector.detect()
     except:
         return 'unknown'
 
-def score_heading_candidate(span, page_width):
+def score_capitalization(text):
+    """Score the capitalization of text, for languages that use it"""
+    all_caps = is_all_caps(text)
+    title_case = is_title_case(text)
+    
+    # Language detection is by far the slowest check, so we only run it when
+    # there is some capitalization to reward and the script hasn't already
+    # ruled it out
+    if not (all_caps or title_case) or is_cjk(text) or is_rtl(text):
+        return 0
+    if detect_language(text) not in CAPS_LANGS:
+        return 0
+    
+    score = 0
+    if all_caps:
+        score += 2
+    if title_case:
+        score += 1
+    return score
+
+def score_capitalizations(spans):
+    """Score the capitalization of each distinct span text"""
+    # This only depends on the text, and the same text shows up many times
+    # in a document, so we check each distinct string just once
+    return {text: score_capitalization(text) for text in {span.text for span in spans}}
+
+def score_heading_candidate(span, caps_scores):
     """Score how likely a text span is to be a heading"""
-    text = normalize_text(span['text'])
+    text = span.text  # already normalized when the span was made
     score = 0
     
     # Font size is a big indicator - larger text is more likely to be a heading
-    score += span['size'] * 2
+    score += span.size * 2
     
     # Bold text is often used for headings
     if is_bold(span):
@@ -107,7 +195,7 @@ def score_heading_candidate(span, page_width):
         score += 1
     
     # Centered text is often a heading
-    if is_centered(span, page_width):
+    if span.centered:
         score += 2
     
     # If it matches our heading patterns (like "1. Introduction"), that's a strong signal
@@ -115,16 +203,7 @@ def score_heading_candidate(span, page_width):
         score += 4
     
     # Handle different languages - some languages don't use capitalization the same way
-    cjk = is_cjk(text)
-    rtl = is_rtl(text)
-    lang = detect_language(text)
-    
-    # Only check capitalization for languages that use it
-    if not cjk and not rtl and lang in ['en', 'fr', 'de', 'es', 'it', 'pt', 'nl', 'sv', 'da', 'fi', 'no', 'pl', 'tr', 'ro', 'cs', 'sk', 'hu', 'sl', 'hr', 'lt', 'lv', 'et', 'bg', 'ca', 'ga', 'mt', 'is', 'sq', 'mk', 'bs', 'sr', 'eu', 'gl', 'af', 'sw', 'zu', 'xh', 'st', 'tn', 'ts', 'ss', 've', 'nr', 'ny', 'mg', 'so', 'rw', 'rn', 'kg', 'lu', 'lg', 'ak', 'ee', 'tw', 'ha', 'yo', 'ig', 'am', 'om', 'ti', 'aa', 'ss', 'tn', 'ts', 've', 'xh', 'zu']:
-        if is_all_caps(text):
-            score += 2
-        if is_title_case(text):
-            score += 1
+    score += caps_scores[text]
     
     # Shorter text is more likely to be a heading
     if len(text) < 40:
@@ -136,11 +215,16 @@ def score_heading_candidate(span, page_width):
     
     return score
 
-def extract_headings_from_page(page):
-    """Extract all potential headings from a single page"""
-    blocks = page.get_text("dict")['blocks']
-    headings = []
+def extract_spans_from_page(page, page_num):
+    """Extract all text spans from a single page"""
+    # The default "dict" flags also pull in every image on the page, which
+    # we never look at, so ask for text only
+    blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)['blocks']
+    spans = []
     page_width = page.rect.width
+    # These are the same for every span on the page, so work them out once
+    page_center = page_width / 2
+    center_tolerance = page_width * 0.15
     
     # Go through all text blocks on the page
     for b in blocks:
@@ -153,64 +237,121 @@ def extract_headings_from_page(page):
                     continue
                 
                 # Create a span object with all the info we need
-                span = {
-                    'text': text,
-                    'size': s['size'],
-                    'flags': s['flags'],
-                    'font': s['font'],
-                    'bbox': s['bbox'],
-                }
-                
-                # Score this span to see if it's likely a heading
-                span['score'] = score_heading_candidate(span, page_width)
-                headings.append(span)
+                span = Span(text, s['size'], s['flags'], s['font'], s['bbox'], page_num)
+                # Centering depends on the page, so check it while we have the page
+                span.centered = is_centered(span, page_center, center_tolerance)
+                spans.append(span)
     
-    return headings
+    return spans
+
+def pick_heading_candidates(spans):
+    """Drop the spans on a page that are plain body text"""
+    if not spans:
+        return []
+    
+    # The font size covering the most characters is the body text size.
+    # Counting characters rather than spans matters on cover pages, where
+    # a big title is often split into lots of short spans
+    sizes = Counter()
+    for span in spans:
+        sizes[round(span.size)] += len(span.text)
+    body_size = sizes.most_common(1)[0][0]
+    
+    # Plain body text is never a heading, so don't bother scoring it
+    return [span for span in spans
+            if round(span.size) > 1.1 * body_size or is_bold(span)
+            or matches_heading_pattern(span.text)]
+
+def heading_level(score):
+    """Pick the heading level for a score, or None if it's too low"""
+    for i, level in enumerate(HEADING_LEVELS):
+        if score >= 10 - 2 * i:  # H1: 10+, H2: 8+, H3: 6+
+            return level
+    return None
 
-def guess_title_and_headings(all_headings_by_page):
+def guess_title_and_headings(first_span, first_page_spans, heading_spans):
     """Figure out the title and organize headings into a proper outline"""
-    # Collect all spans from all pages
-    all_spans = []
-    for page_num, spans in all_headings_by_page.items():
-        for s in spans:
-            s['page'] = page_num
-            all_spans.append(s)
-    
-    if not all_spans:
+    if first_span is None:
         return "", []
     
-    # The title is usually the highest-scoring text on the first page
-    first_page_spans = all_headings_by_page.get(1, [])
+    # The title is usually the highest-scoring text on the first page.
+    # We look at every span there, not just the heading candidates
     if first_page_spans:
-        title_span = max(first_page_spans, key=lambda s: s['score'])
-        title = title_span['text']
+        title_span = max(first_page_spans, key=lambda s: s.score)
+        title = title_span.text
     else:
-        # Fallback to the first span if no first page
-        title = all_spans[0]['text']
+        # Fallback to the first span in the document if the first page has no text
+        title = first_span.text
     
     # Sort all spans by score (highest first) and then by font size
-    sorted_spans = sorted(all_spans, key=lambda s: (-s['score'], -s['size']))
+    sorted_spans = sorted(heading_spans, key=lambda s: (-s.score, -s.size))
     
     # Assign heading levels based on scores
     # H1 needs score 10+, H2 needs 8+, H3 needs 6+
     outline = []
     used = set()  # Avoid duplicates
     
-    for level in HEADING_LEVELS:
-        for s in sorted_spans:
-            key = (s['text'], s['page'])
-            if key in used:
-                continue
-            if s['score'] >= 10 - 2 * HEADING_LEVELS.index(level):  # H1: 10+, H2: 8+, H3: 6+
-                outline.append({
-                    'level': level,
-                    'text': s['text'],
-                    'page': s['page']
-                })
-                used.add(key)
+    # Spans are sorted by score and the thresholds go down with the level,
+    # so one pass already gives us all H1s, then H2s, then H3s
+    for s in sorted_spans:
+        level = heading_level(s.score)
+        if level is None:
+            break
+        key = (s.text, s.page)
+        if key in used:
+            continue
+        outline.append({
+            'level': level,
+            'text': s.text,
+            'page': s.page
+        })
+        used.add(key)
     
     return title, outline
 
+def process_pdf(pdf_file, output_dir):
+    """Extract the outline of one PDF and write it to a JSON file"""
+    try:
+        # Open the PDF and extract headings from each page
+        # Each worker opens its own document, fitz documents can't be shared
+        doc = fitz.open(pdf_file)
+        first_span = None
+        first_page_spans = []
+        heading_spans = []
+        
+        for i, page in enumerate(doc, 1):
+            spans = extract_spans_from_page(page, i)
+            if first_span is None and spans:
+                first_span = spans[0]
+            if i == 1:
+                first_page_spans = spans
+            heading_spans.extend(pick_heading_candidates(spans))
+        
+        # Check capitalization and language for the whole document at once,
+        # then score each span to see if it's likely a heading. First page
+        # spans are title candidates too, even when they aren't heading candidates
+        to_score = set(first_page_spans).union(heading_spans)
+        caps_scores = score_capitalizations(to_score)
+        for span in to_score:
+            span.score = score_heading_candidate(span, caps_scores)
+        
+        # Figure out the title and create the outline
+        title, outline = guess_title_and_headings(first_span, first_page_spans, heading_spans)
+        
+        output = {
+            "title": title,
+            "outline": outline
+        }
+    except Exception as e:
+        # If something goes wrong, return empty results with error info
+        output = {"title": "", "outline": [], "error": str(e)}
+    
+    # Write the results to a JSON file
+    output_file = output_dir / f"{pdf_file.stem}.json"
+    # orjson writes UTF-8 bytes directly and is much faster than json.dump
+    output_file.write_bytes(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+    print(f"Processed {pdf_file.name} -> {output_file.name}")
+
 def process_pdfs():
     """Main function to process all PDFs in the input directory"""
     input_dir = Path("/app/input")
@@ -219,33 +360,14 @@ def process_pdfs():
     
     # Find all PDF files in the input directory
     pdf_files = list(input_dir.glob("*.pdf"))
+    if not pdf_files:
+        return
     
-    for pdf_file in pdf_files:
-        try:
-            # Open the PDF and extract headings from each page
-            doc = fitz.open(pdf_file)
-            all_headings_by_page = defaultdict(list)
-            
-            for i, page in enumerate(doc, 1):
-                spans = extract_headings_from_page(page)
-                all_headings_by_page[i].extend(spans)
-            
-            # Figure out the title and create the outline
-            title, outline = guess_title_and_headings(all_headings_by_page)
-            
-            output = {
-                "title": title,
-                "outline": outline
-            }
-        except Exception as e:
-            # If something goes wrong, return empty results with error info
-            output = {"title": "", "outline": [], "error": str(e)}
-        
-        # Write the results to a JSON file
-        output_file = output_dir / f"{pdf_file.stem}.json"
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
-        print(f"Processed {pdf_file.name} -> {output_file.name}")
+    # Every PDF is independent and the work is CPU-bound Python, so we use
+    # processes rather than threads to get around the GIL
+    max_workers = min(len(pdf_files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(process_pdf, pdf_files, [output_dir] * len(pdf_files)))
 
 if __name__ == "__main__":
     print("Starting PDF processing...")